@@ -5,111 +5,73 @@ Creates a WiFi hotspot and serves a captive portal web page
 Enhanced to ensure hotspot is visible on all devices
 """
 
+import contextlib
+import hashlib
+import select
 import subprocess
 import sys
 import time
 import threading
 import signal
 import os
+import re
+import shutil
 import socket
+import struct
 import netifaces
 import logging
+from pyroute2 import IPRoute
+from pyroute2.netlink.exceptions import NetlinkError
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from web.web_app import WebApp
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-class HotspotPortal:
-    def __init__(self, ssid="ActivePortal", password="portal123", interface="wlan0"):
-        self.ssid = ssid
-        self.password = password
-        # Clean interface name by removing trailing colons and invalid characters
-        self.interface = interface.rstrip(':').strip()
-        if not self.interface:
-            self.interface = "wlan0"
-        self.web_app = WebApp()
-        self.hostapd_process = None
-        self.dnsmasq_process = None
-        self.flask_thread = None
-        self.running = False
-        
-    
-    def validate_interface(self):
-        """Validate that the interface exists and supports AP mode"""
-        try:
-            # Check if interface exists
-            result = subprocess.run(['ip', 'link', 'show', self.interface], capture_output=True, text=True)
-            if result.returncode != 0:
-                logger.error(f"Interface {self.interface} does not exist")
-                return False
+# Common wireless interface names: wlan0, wlo1, wlp2s0, wlx<mac>, wifi0
+WIRELESS_INTERFACE_RE = re.compile(r'^(?:wlan\d|wlo\d|wlp\d|wlx[0-9a-f]{12}|wifi\d)', re.IGNORECASE)
 
-            # Check if interface is wireless (relaxed check)
-            if not any(wireless in self.interface for wireless in ['wlan', 'wlo', 'wlx', 'wifi', 'wlp']):
-                logger.warning(f"Interface {self.interface} may not be wireless, but continuing anyway")
-
-            logger.info(f"✅ Interface {self.interface} validation passed")
-            return True
+# Interface flag and rfkill constants from <linux/if.h> and <linux/rfkill.h>
+IFF_UP = 0x1
+RFKILL_TYPE_ALL = 0
+RFKILL_OP_CHANGE_ALL = 3
 
-        except Exception as e:
-            logger.error(f"Error validating interface {self.interface}: {e}")
-            return False
-    
-    def check_root(self):
-        """Check if running as root"""
-        if os.geteuid() != 0:
-            logger.error("This script must be run as root (use sudo)")
-            sys.exit(1)
+# Link state reported by 'ip -o monitor link', e.g. "... state DOWN mode DEFAULT ..."
+LINK_STATE_RE = re.compile(r'\bstate (\S+)')
 
-    def check_dependencies(self):
-        """Check if required tools are installed"""
-        required_tools = ['hostapd', 'dnsmasq', 'iptables']
-        missing_tools = []
-        
-        for tool in required_tools:
-            try:
-                subprocess.run(['which', tool], check=True, capture_output=True)
-            except subprocess.CalledProcessError:
-                missing_tools.append(tool)
-        
-        if missing_tools:
-            logger.error(f"Missing required tools: {', '.join(missing_tools)}")
-            logger.error("Install with: sudo apt update && sudo apt install hostapd dnsmasq iptables")
-            sys.exit(1)
-    
-    def unblock_wireless(self):
-        """Ensure wireless is not blocked by rfkill"""
-        logger.info("🔓 Checking wireless blocks...")
-        try:
-            # Unblock all wireless devices
-            subprocess.run(['rfkill', 'unblock', 'wifi'], check=False)
-            subprocess.run(['rfkill', 'unblock', 'wlan'], check=False)
-            subprocess.run(['rfkill', 'unblock', 'all'], check=False)
-            logger.info("✅ Wireless unblocked")
-        except Exception as e:
-            logger.warning(f"Could not unblock wireless: {e}")
+# nftables ruleset for the hotspot, loaded in one atomic transaction. It lives in
+# its own table so cleanup can remove every rule with a single delete. The
+# leading "table"/"delete table" pair drops any copy left by an earlier run.
+# Only NAT rules go here: an accept in this table cannot override a drop in
+# another table's input/forward chain, so filtering is left to the host.
+NFT_TABLE = 'captive'
+NFT_RULESET = """table inet {table}
+delete table inet {table}
+table inet {table} {{
+    chain prerouting {{
+        type nat hook prerouting priority -100; policy accept;
+        iifname "{iface}" tcp dport {{ 80, 443 }} dnat ip to 192.168.4.1:5000
+        iifname "{iface}" udp dport 53 dnat ip to 192.168.4.1:53
+    }}
+    chain postrouting {{
+        type nat hook postrouting priority 100; policy accept;
+        oifname "{inet}" masquerade
+    }}
+}}
+"""
 
-    def stop_network_manager_on_interface(self):
-        """Stop NetworkManager from managing the hotspot interface"""
-        logger.info(f"🛑 Unmanaging {self.interface} from NetworkManager...")
-        try:
-            # Set interface as unmanaged
-            subprocess.run(['nmcli', 'device', 'set', self.interface, 'managed', 'no'], 
-                          check=False, capture_output=True)
-            time.sleep(1)
-            logger.info(f"✅ NetworkManager will not interfere with {self.interface}")
-        except Exception as e:
-            logger.warning(f"Could not unmanage interface from NetworkManager: {e}")
+# Table header and drop-policy input/forward base chains in 'nft list chains' output
+NFT_TABLE_HEADER_RE = re.compile(r'^table (\S+ \S+) \{')
+NFT_DROP_HOOK_RE = re.compile(r'\bhook (input|forward)\b.*\bpolicy drop\b')
 
-    def create_hostapd_config(self):
-        """Create hostapd configuration file - OPTIMIZED FOR VISIBILITY"""
-        # Use channel 6 (most compatible) instead of 7
-        config = f"""# Hostapd Configuration - OPTIMIZED FOR VISIBILITY
-interface={self.interface}
+# hostapd configuration - channel 6 is the most universally compatible
+HOSTAPD_CONFIG = """# Hostapd Configuration - OPTIMIZED FOR VISIBILITY
+interface={interface}
 driver=nl80211
 
 # SSID and broadcast - CRITICAL FOR VISIBILITY
-ssid={self.ssid}
+ssid={ssid}
 ignore_broadcast_ssid=0
 utf8_ssid=1
 
@@ -124,7 +86,7 @@ wmm_enabled=1
 # Security settings
 auth_algs=1
 wpa=2
-wpa_passphrase={self.password}
+wpa_passphrase={password}
 wpa_key_mgmt=WPA-PSK
 wpa_pairwise=CCMP
 rsn_pairwise=CCMP
@@ -150,50 +112,47 @@ max_num_sta=50
 # Disable AP isolation
 ap_isolate=0
 
-# Enhanced logging
+# Control interface (used to detect when hostapd is ready)
+ctrl_interface=/var/run/hostapd
+
+# Logging (warnings and above; per-station info/notification events are too chatty)
 logger_syslog=-1
 logger_stdout=2
-logger_syslog_level=2
-logger_stdout_level=2
+logger_syslog_level=4
+logger_stdout_level=4
 
 # Additional compatibility settings
 preamble=1
 """
-        
-        with open('/tmp/hostapd.conf', 'w') as f:
-            f.write(config)
-        
-        logger.info("✅ Created optimized hostapd configuration")
-        logger.info(f"   SSID: {self.ssid}")
-        logger.info(f"   Channel: 6 (most compatible)")
-        logger.info(f"   Broadcast: ENABLED")
-    
-    def verify_hostapd_config(self):
-        """Test hostapd configuration before starting"""
-        logger.info("🧪 Testing hostapd configuration...")
-        try:
-            result = subprocess.run(
-                ['hostapd', '-t', '/tmp/hostapd.conf'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if result.returncode == 0:
-                logger.info("✅ hostapd configuration is valid")
-                return True
-            else:
-                logger.error(f"❌ hostapd configuration error: {result.stderr}")
-                return False
-        except subprocess.TimeoutExpired:
-            logger.info("✅ hostapd configuration test passed (timeout is normal)")
-            return True
-        except Exception as e:
-            logger.warning(f"Could not test hostapd config: {e}")
-            return True  # Continue anyway
 
-    def create_dnsmasq_config(self):
-        """Create dnsmasq configuration file"""
-        config = f"""interface={self.interface}
+# hostapd's stdout/stderr go here rather than to an unread pipe
+HOSTAPD_LOG = '/tmp/hostapd.log'
+
+# Hostnames that operating systems probe to detect a captive portal. dnsmasq
+# answers these with the portal address via an addn-hosts file. Clients that
+# support DHCP option 114 (RFC 8910) find the portal without them.
+CAPTIVE_HOSTS_FILE = '/tmp/captive_hosts'
+
+# SHA-256 of the last dnsmasq config that passed 'dnsmasq --test'. Written only
+# after a passing test and kept across cleanup, so an identical config on the
+# next start skips the test.
+DNSMASQ_TEST_STAMP = '/tmp/.dnsmasq.conf.sha256'
+CAPTIVE_DOMAINS = (
+    # Android
+    'connectivitycheck.gstatic.com',
+    'connectivitycheck.android.com',
+    'clients3.google.com',
+    'www.google.com',
+    # iOS / macOS
+    'captive.apple.com',
+    'www.apple.com',
+    # Windows
+    'www.msftconnecttest.com',
+    'msftconnecttest.com',
+)
+
+# dnsmasq DHCP/DNS configuration for the 192.168.4.0/24 hotspot subnet
+DNSMASQ_CONFIG = """interface={interface}
 dhcp-range=192.168.4.2,192.168.4.50,255.255.255.0,24h
 dhcp-leasefile=/tmp/dnsmasq.leases
 dhcp-authoritative
@@ -211,15 +170,14 @@ dhcp-option=43,192.168.4.1
 # Rapid DHCP for faster connection
 dhcp-rapid-commit
 
-# DNS servers
+# DNS servers (query all in parallel and use the fastest answer)
 server=8.8.8.8
 server=1.1.1.1
 server=208.67.222.222
+all-servers
+dns-forward-max=300
 
-# Logging
-log-queries
-log-dhcp
-
+{logging}
 # Listen addresses
 listen-address=127.0.0.1
 listen-address=192.168.4.1
@@ -228,61 +186,171 @@ no-dhcp-interface=eth0
 no-dhcp-interface=lo
 
 # Captive portal detection redirects
-address=/clients3.google.com/192.168.4.1
-address=/connectivitycheck.gstatic.com/192.168.4.1
-address=/connectivitycheck.android.com/192.168.4.1
-address=/google.com/192.168.4.1
-address=/captive.apple.com/192.168.4.1
-address=/www.apple.com/192.168.4.1
-address=/www.msftconnecttest.com/192.168.4.1
-address=/msftconnecttest.com/192.168.4.1
-address=/ncsi.txt/192.168.4.1
-address=/hotspot-detect.html/192.168.4.1
-address=/generate_204/192.168.4.1
-address=/connectivity-check.html/192.168.4.1
-address=/success.txt/192.168.4.1
+no-hosts
+addn-hosts={hosts_file}
 
 # DNS caching
-cache-size=1000
+cache-size=10000
+min-cache-ttl=300
 neg-ttl=3600
 
 # Additional options
 dhcp-option=252,"\\n"
+# Captive portal URI (RFC 8910)
 dhcp-option=114,http://192.168.4.1:5000/
 """
+
+class HotspotPortal:
+    def __init__(self, ssid="ActivePortal", password="portal123", interface="wlan0"):
+        self.ssid = ssid
+        self.password = password
+        # Clean interface name by removing trailing colons and invalid characters
+        self.interface = interface.rstrip(':').strip()
+        if not self.interface:
+            self.interface = "wlan0"
+        self.web_app = WebApp()
+        self.hostapd_process = None
+        self.dnsmasq_process = None
+        self.flask_thread = None
+        self.running = False
+        self._stop_event = threading.Event()
+        self._internet_interface = None
+        self._ip_monitor = None
+        self._link_state = None
+        self._dnsmasq_config_digest = None
         
-        with open('/tmp/dnsmasq.conf', 'w') as f:
-            f.write(config)
+    
+    def validate_interface(self):
+        """Validate that the interface exists and supports AP mode"""
+        try:
+            # Check if interface exists
+            if self.interface not in netifaces.interfaces():
+                logger.error(f"Interface {self.interface} does not exist")
+                return False
+
+            # Check if interface is wireless (relaxed check)
+            if not WIRELESS_INTERFACE_RE.match(self.interface):
+                logger.warning(f"Interface {self.interface} may not be wireless, but continuing anyway")
+
+            logger.info(f"✅ Interface {self.interface} validation passed")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error validating interface {self.interface}: {e}")
+            return False
+    
+    def check_root(self):
+        """Check if running as root"""
+        if os.geteuid() != 0:
+            logger.error("This script must be run as root (use sudo)")
+            sys.exit(1)
+
+    def check_dependencies(self):
+        """Check if required tools are installed"""
+        required_tools = ['hostapd', 'dnsmasq', 'nft']
+        missing_tools = [tool for tool in required_tools if shutil.which(tool) is None]
+        
+        if missing_tools:
+            logger.error(f"Missing required tools: {', '.join(missing_tools)}")
+            logger.error("Install with: sudo apt update && sudo apt install hostapd dnsmasq nftables")
+            sys.exit(1)
+    
+    def unblock_wireless(self):
+        """Ensure wireless is not blocked by rfkill"""
+        logger.info("🔓 Checking wireless blocks...")
+        try:
+            # Soft-unblock every radio with a single RFKILL_OP_CHANGE_ALL event
+            # (struct rfkill_event: idx, type, op, soft, hard)
+            event = struct.pack('=IBBBB', 0, RFKILL_TYPE_ALL, RFKILL_OP_CHANGE_ALL, 0, 0)
+            fd = os.open('/dev/rfkill', os.O_WRONLY)
+            try:
+                os.write(fd, event)
+            finally:
+                os.close(fd)
+            logger.info("✅ Wireless unblocked")
+        except Exception as e:
+            logger.warning(f"Could not unblock wireless: {e}")
+
+    def stop_network_manager_on_interface(self):
+        """Stop NetworkManager from managing the hotspot interface"""
+        logger.info(f"🛑 Unmanaging {self.interface} from NetworkManager...")
+        try:
+            # Set interface as unmanaged
+            subprocess.run(['nmcli', 'device', 'set', self.interface, 'managed', 'no'], 
+                          check=False, capture_output=True)
+            time.sleep(1)
+            logger.info(f"✅ NetworkManager will not interfere with {self.interface}")
+        except Exception as e:
+            logger.warning(f"Could not unmanage interface from NetworkManager: {e}")
+
+    def create_hostapd_config(self):
+        """Create hostapd configuration file - OPTIMIZED FOR VISIBILITY"""
+        config = HOSTAPD_CONFIG.format(interface=self.interface, ssid=self.ssid, password=self.password)
+        
+        self.write_config('/tmp/hostapd.conf', config)
+        
+        logger.info("✅ Created optimized hostapd configuration")
+        logger.info(f"   SSID: {self.ssid}")
+        logger.info(f"   Channel: 6 (most compatible)")
+        logger.info(f"   Broadcast: ENABLED")
+    
+    def create_dnsmasq_config(self, verbose=False):
+        """Create dnsmasq configuration file (per-query/DHCP logging only when verbose)"""
+        hosts = ''.join(f"192.168.4.1 {domain}\n" for domain in CAPTIVE_DOMAINS)
+        # dnsmasq re-reads addn-hosts after dropping root, so keep it world-readable
+        self.write_config(CAPTIVE_HOSTS_FILE, hosts, mode=0o644)
+        logging_options = "# Logging\nlog-queries\nlog-dhcp\n" if verbose else ""
+        config = DNSMASQ_CONFIG.format(interface=self.interface, hosts_file=CAPTIVE_HOSTS_FILE,
+                                       logging=logging_options)
+        
+        self.write_config('/tmp/dnsmasq.conf', config)
+        self._dnsmasq_config_digest = hashlib.sha256(config.encode()).hexdigest()
         
         logger.info("✅ Created dnsmasq configuration")
     
-    def find_internet_interface(self):
+    def dnsmasq_config_tested(self):
+        """True if the current dnsmasq config is the one recorded by the last passing --test"""
+        try:
+            with open(DNSMASQ_TEST_STAMP) as f:
+                return f.read() == self._dnsmasq_config_digest
+        except OSError:
+            return False
+
+    def write_config(self, path, content, mode=0o600):
+        """Atomically write a config file (temp file + fsync + rename)"""
+        tmp_path = f"{path}.tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+        try:
+            os.write(fd, content.encode())
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.rename(tmp_path, path)
+
+    def find_internet_interface(self, refresh=False):
+        """Return the main internet interface, cached for the lifetime of the portal"""
+        if self._internet_interface is None or refresh:
+            self._internet_interface = self.detect_internet_interface()
+        return self._internet_interface
+
+    def detect_internet_interface(self):
         """Find the main internet interface (not the hotspot interface)"""
         try:
-            # Get all interfaces
-            result = subprocess.run(['ip', 'route', 'show', 'default'], capture_output=True, text=True)
-            if result.returncode == 0:
-                for line in result.stdout.split('\n'):
-                    if 'default via' in line:
-                        parts = line.split()
-                        for i, part in enumerate(parts):
-                            if part == 'dev':
-                                interface = parts[i + 1]
-                                if interface != self.interface:
-                                    logger.info(f"📡 Internet interface: {interface}")
-                                    return interface
+            # Take the first default IPv4 route that does not use the hotspot interface
+            # (netifaces reads the routing table in-process, no 'ip' subprocess)
+            for _, interface, is_default in netifaces.gateways().get(netifaces.AF_INET, []):
+                if is_default and interface != self.interface:
+                    logger.info(f"📡 Internet interface: {interface}")
+                    return interface
             
-            # Fallback to common interfaces
+            # Fallback to common interfaces that have an IPv4 address
+            available = set(netifaces.interfaces())
             common_interfaces = ['eth0', 'eno1', 'ens192', 'wlo1', 'enp0s3', 'enp1s0']
             for interface in common_interfaces:
-                if interface != self.interface:
-                    try:
-                        result = subprocess.run(['ip', 'addr', 'show', interface], capture_output=True, text=True)
-                        if result.returncode == 0 and 'inet ' in result.stdout:
-                            logger.info(f"📡 Using fallback internet interface: {interface}")
-                            return interface
-                    except:
-                        continue
+                if (interface != self.interface and interface in available
+                        and netifaces.ifaddresses(interface).get(netifaces.AF_INET)):
+                    logger.info(f"📡 Using fallback internet interface: {interface}")
+                    return interface
             
             logger.warning("⚠️ Could not determine internet interface, using eth0")
             return 'eth0'
@@ -291,18 +359,70 @@ dhcp-option=114,http://192.168.4.1:5000/
             logger.warning(f"Error finding internet interface: {e}, using eth0")
             return 'eth0'
     
+    def apply_firewall_rules(self, internet_interface):
+        """Load the hotspot NAT and filter rules as one atomic nftables transaction"""
+        ruleset = NFT_RULESET.format(table=NFT_TABLE, iface=self.interface, inet=internet_interface)
+        subprocess.run(['nft', '-f', '-'], input=ruleset, text=True, check=True)
+
+    def remove_firewall_rules(self):
+        """Delete the hotspot nftables table and every rule in it"""
+        subprocess.run(['nft', 'delete', 'table', 'inet', NFT_TABLE], capture_output=True, check=False)
+
     def stop_conflicting_services(self):
         """Stop conflicting services only for the hotspot interface"""
         logger.info("🛑 Stopping conflicting services...")
         
         # Stop existing processes
-        subprocess.run(['pkill', 'dnsmasq'], check=False)
-        subprocess.run(['pkill', 'hostapd'], check=False)
-        subprocess.run(['pkill', '-f', f'dhcpcd.*{self.interface}'], check=False)
+        self.kill_processes('dnsmasq')
+        self.kill_processes('hostapd')
+        self.kill_processes(cmdline_pattern=f'dhcpcd.*{re.escape(self.interface)}')
         
-        time.sleep(2)
+        if not self.wait_for_processes_exit(['dnsmasq', 'hostapd']):
+            logger.warning("⚠️ Some conflicting services are still running")
         logger.info("✅ Conflicting services stopped")
 
+    def poll_until(self, condition, timeout, process=None):
+        """Poll condition with exponential backoff (10-200 ms) until it is true or timeout expires"""
+        delay = 0.01
+        deadline = time.monotonic() + timeout
+        while True:
+            if condition():
+                return True
+            # Stop early if the process we are waiting on has died
+            if process is not None and process.poll() is not None:
+                return False
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.2)
+
+    def wait_for_processes_exit(self, names, timeout=2.0):
+        """Wait until none of the named processes are running"""
+        return self.poll_until(
+            lambda: self.running_process_names().isdisjoint(names),
+            timeout)
+
+    def wait_for_unix_socket(self, path, timeout=5.0, process=None):
+        """Wait until a UNIX datagram socket at path accepts connections (a stale socket file refuses them)"""
+        def socket_ready():
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                try:
+                    sock.connect(path)
+                    return True
+                except OSError:
+                    return False
+        return self.poll_until(socket_ready, timeout, process)
+
+    def wait_for_tcp(self, host, port, timeout=5.0, process=None):
+        """Wait until a TCP connection to host:port succeeds"""
+        def port_open():
+            try:
+                with socket.create_connection((host, port), timeout=0.1):
+                    return True
+            except OSError:
+                return False
+        return self.poll_until(port_open, timeout, process)
+
     def setup_network(self):
         """Setup network interface and routing"""
         try:
@@ -315,94 +435,131 @@ dhcp-option=114,http://192.168.4.1:5000/
             # Stop conflicting services
             self.stop_conflicting_services()
             
-            # Bring down interface
+            # Configure the interface over netlink
             logger.info(f"🔧 Configuring interface {self.interface}...")
-            subprocess.run(['ip', 'link', 'set', self.interface, 'down'], check=True)
-            
-            # Clear any existing IP addresses
-            subprocess.run(['ip', 'addr', 'flush', 'dev', self.interface], check=False)
-            
-            # Configure interface
-            subprocess.run(['ip', 'addr', 'add', '192.168.4.1/24', 'dev', self.interface], check=True)
-            subprocess.run(['ip', 'link', 'set', self.interface, 'up'], check=True)
-            
-            # Verify interface is up
-            result = subprocess.run(['ip', 'link', 'show', self.interface], capture_output=True, text=True)
-            if "UP" in result.stdout:
+            with IPRoute() as ipr:
+                index = ipr.link_lookup(ifname=self.interface)[0]
+                ipr.link('set', index=index, state='down')
+                
+                # Clear any existing IP addresses
+                try:
+                    ipr.flush_addr(index=index)
+                except NetlinkError as e:
+                    logger.warning(f"Could not flush addresses on {self.interface}: {e}")
+                
+                ipr.addr('add', index=index, address='192.168.4.1', prefixlen=24)
+                ipr.link('set', index=index, state='up')
+                
+                # Verify interface is up
+                flags = ipr.get_links(index)[0]['flags']
+            if flags & IFF_UP:
                 logger.info(f"✅ Interface {self.interface} is UP")
             else:
                 logger.error(f"❌ Interface {self.interface} failed to come UP")
                 raise Exception("Interface failed to start")
             
-            # Enable IP forwarding
-            with open('/proc/sys/net/ipv4/ip_forward', 'w') as f:
-                f.write('1')
+            # Enable IP forwarding (skip the sysctl write if the host already has it on)
+            with open('/proc/sys/net/ipv4/ip_forward', 'rb') as f:
+                ip_forward = f.read(1)
+            if ip_forward != b'1':
+                fd = os.open('/proc/sys/net/ipv4/ip_forward', os.O_WRONLY)
+                try:
+                    os.write(fd, b'1')
+                finally:
+                    os.close(fd)
             
             # Find the main internet interface
             internet_interface = self.find_internet_interface()
             
-            # Setup iptables rules for NAT
-            subprocess.run(['iptables', '-t', 'nat', '-A', 'POSTROUTING', '-o', internet_interface, '-j', 'MASQUERADE'], check=True)
-            subprocess.run(['iptables', '-A', 'FORWARD', '-i', self.interface, '-o', internet_interface, '-j', 'ACCEPT'], check=True)
-            subprocess.run(['iptables', '-A', 'FORWARD', '-i', internet_interface, '-o', self.interface, '-m', 'state', '--state', 'RELATED,ESTABLISHED', '-j', 'ACCEPT'], check=True)
-            
-            # Redirect traffic to captive portal
-            subprocess.run(['iptables', '-t', 'nat', '-A', 'PREROUTING', '-i', self.interface, '-p', 'tcp', '--dport', '80', '-j', 'DNAT', '--to-destination', '192.168.4.1:5000'], check=True)
-            subprocess.run(['iptables', '-t', 'nat', '-A', 'PREROUTING', '-i', self.interface, '-p', 'tcp', '--dport', '443', '-j', 'DNAT', '--to-destination', '192.168.4.1:5000'], check=True)
-            subprocess.run(['iptables', '-t', 'nat', '-A', 'PREROUTING', '-i', self.interface, '-p', 'udp', '--dport', '53', '-j', 'DNAT', '--to-destination', '192.168.4.1:53'], check=True)
-            
-            # Allow necessary traffic
-            subprocess.run(['iptables', '-A', 'INPUT', '-i', self.interface, '-p', 'icmp', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-A', 'INPUT', '-i', self.interface, '-p', 'udp', '--dport', '67', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-A', 'INPUT', '-i', self.interface, '-p', 'udp', '--dport', '68', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-A', 'INPUT', '-i', self.interface, '-p', 'udp', '--dport', '53', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-A', 'INPUT', '-i', self.interface, '-p', 'tcp', '--dport', '53', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-A', 'INPUT', '-i', self.interface, '-p', 'tcp', '--dport', '5000', '-j', 'ACCEPT'], check=False)
+            # Setup NAT, captive portal redirects and input rules in one batch
+            self.apply_firewall_rules(internet_interface)
             
             logger.info("✅ Network setup completed")
             
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, NetlinkError) as e:
             logger.error(f"❌ Network setup failed: {e}")
             raise
     
+    @contextlib.contextmanager
+    def hostapd_ctrl(self):
+        """Datagram socket connected to hostapd's control interface for the hotspot interface"""
+        local_path = f'/tmp/hostapd_ctrl_{os.getpid()}_{threading.get_ident()}'
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            if os.path.exists(local_path):
+                os.unlink(local_path)
+            # hostapd replies to the sender's address, so the client socket must be bound
+            sock.bind(local_path)
+            sock.connect(f'/var/run/hostapd/{self.interface}')
+            yield sock
+        finally:
+            sock.close()
+            try:
+                os.unlink(local_path)
+            except OSError:
+                pass
+
+    def hostapd_status(self, timeout=2.0):
+        """Return the reply to hostapd's STATUS control command"""
+        with self.hostapd_ctrl() as sock:
+            sock.settimeout(timeout)
+            sock.send(b'STATUS')
+            return sock.recv(4096).decode(errors='replace')
+
+    def wait_for_ap_enabled(self, timeout=10.0):
+        """Wait for the AP-ENABLED event on hostapd's control interface (no radio scan needed)"""
+        try:
+            with self.hostapd_ctrl() as sock:
+                # Subscribe to events, then ask for the current state in case
+                # AP-ENABLED was already sent before we attached
+                sock.send(b'ATTACH')
+                sock.send(b'STATUS')
+                deadline = time.monotonic() + timeout
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not select.select([sock], [], [], remaining)[0]:
+                        return False
+                    message = sock.recv(4096)
+                    if b'AP-ENABLED' in message or b'state=ENABLED' in message:
+                        return True
+        except OSError as e:
+            logger.warning(f"Could not attach to hostapd control interface: {e}")
+            return False
+
     def start_hostapd(self):
         """Start hostapd daemon with verification"""
         try:
             logger.info("🚀 Starting hostapd...")
             
-            # Start hostapd in background
-            self.hostapd_process = subprocess.Popen(
-                ['hostapd', '/tmp/hostapd.conf'],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE
-            )
+            # Start hostapd in background; its output goes to a log file so a
+            # long-running AP can never block on a full, unread pipe
+            with open(HOSTAPD_LOG, 'wb') as log:
+                self.hostapd_process = subprocess.Popen(
+                    ['hostapd', '/tmp/hostapd.conf'],
+                    stdout=log,
+                    stderr=subprocess.STDOUT
+                )
             
-            # Wait and verify it started
-            time.sleep(3)
+            # Wait for the control socket, which hostapd creates once it is up
+            if not self.wait_for_unix_socket(f'/var/run/hostapd/{self.interface}',
+                                             process=self.hostapd_process):
+                logger.warning("⚠️ hostapd control socket did not appear in time")
             
             # Check if process is still running
             if self.hostapd_process.poll() is not None:
                 # Process died
-                stdout, stderr = self.hostapd_process.communicate()
+                with open(HOSTAPD_LOG, 'r', errors='replace') as log:
+                    output = log.read()
                 logger.error(f"❌ hostapd failed to start!")
-                logger.error(f"Error: {stderr.decode()}")
+                logger.error(f"Error: {output}")
                 raise Exception("hostapd failed to start")
             
-            # Verify SSID is broadcasting
-            result = subprocess.run(
-                ['iw', 'dev', self.interface, 'scan'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            
-            if self.ssid in result.stdout:
+            # Wait for hostapd to report that the AP is broadcasting
+            if self.wait_for_ap_enabled():
                 logger.info(f"✅ hostapd started - SSID '{self.ssid}' IS BROADCASTING!")
             else:
-                logger.warning(f"⚠️ hostapd started but SSID not visible in scan yet (may take a moment)")
+                logger.warning(f"⚠️ hostapd started but has not reported AP-ENABLED yet (may take a moment)")
             
-        except subprocess.TimeoutExpired:
-            logger.info("✅ hostapd started (scan timeout is normal)")
         except Exception as e:
             logger.error(f"❌ Failed to start hostapd: {e}")
             raise
@@ -411,33 +568,42 @@ dhcp-option=114,http://192.168.4.1:5000/
         """Start dnsmasq daemon"""
         try:
             # Kill any existing dnsmasq processes
-            subprocess.run(['pkill', 'dnsmasq'], check=False)
-            time.sleep(1)
+            self.kill_processes('dnsmasq')
+            self.wait_for_processes_exit(['dnsmasq'])
             
-            # Test dnsmasq configuration
-            test_result = subprocess.run(['dnsmasq', '--test', '--conf-file=/tmp/dnsmasq.conf'], 
-                                       capture_output=True, text=True)
-            if test_result.returncode != 0:
-                logger.error(f"❌ DNSmasq configuration error: {test_result.stderr}")
-                raise Exception(f"DNSmasq configuration invalid: {test_result.stderr}")
+            # Test dnsmasq configuration, unless this exact config already passed
+            if self.dnsmasq_config_tested():
+                logger.info("✅ dnsmasq configuration unchanged since its last passing test")
+            else:
+                test_result = subprocess.run(['dnsmasq', '--test', '--conf-file=/tmp/dnsmasq.conf'], 
+                                           capture_output=True, text=True)
+                if test_result.returncode != 0:
+                    logger.error(f"❌ DNSmasq configuration error: {test_result.stderr}")
+                    raise Exception(f"DNSmasq configuration invalid: {test_result.stderr}")
+                self.write_config(DNSMASQ_TEST_STAMP, self._dnsmasq_config_digest)
             
             # Start dnsmasq
             self.dnsmasq_process = subprocess.Popen(['dnsmasq', '--conf-file=/tmp/dnsmasq.conf', '--no-daemon'])
-            logger.info("✅ Started dnsmasq")
-            time.sleep(2)
+            if self.wait_for_tcp('192.168.4.1', 53, process=self.dnsmasq_process):
+                logger.info("✅ Started dnsmasq")
+            elif self.dnsmasq_process.poll() is not None:
+                raise Exception(f"dnsmasq exited with code {self.dnsmasq_process.returncode}")
+            else:
+                logger.warning("⚠️ dnsmasq started but is not answering on port 53 yet")
         except Exception as e:
             logger.error(f"❌ Failed to start dnsmasq: {e}")
             raise
     
     def start_flask(self):
-        """Start Flask web server"""
+        """Start the portal web app on a multi-threaded waitress WSGI server"""
         try:
-            self.flask_thread = threading.Thread(
-                target=lambda: self.web_app.run(debug=False)
-            )
+            self.flask_thread = threading.Thread(target=self.web_app.run, kwargs={'debug': False})
             self.flask_thread.daemon = True
             self.flask_thread.start()
-            logger.info("✅ Started Flask web server on port 5000")
+            if self.wait_for_tcp(self.web_app.host, self.web_app.port):
+                logger.info(f"✅ Started web server (waitress) on port {self.web_app.port}")
+            else:
+                logger.warning(f"⚠️ Web server is not accepting connections on port {self.web_app.port} yet")
         except Exception as e:
             logger.error(f"❌ Failed to start Flask: {e}")
             raise
@@ -451,48 +617,41 @@ dhcp-option=114,http://192.168.4.1:5000/
         checks_passed = 0
         total_checks = 4
         
+        probes = self.probe_system_state(('processes', 'link_state', 'hostapd_status', 'interface_info'))
+        
         # Check 1: hostapd running
-        result = subprocess.run(['pgrep', 'hostapd'], capture_output=True)
-        if result.returncode == 0:
+        if 'hostapd' in self.probe_result(probes, 'processes', set()):
             logger.info("✅ Check 1/4: hostapd is running")
             checks_passed += 1
         else:
             logger.error("❌ Check 1/4: hostapd is NOT running")
         
         # Check 2: Interface is UP
-        result = subprocess.run(['ip', 'link', 'show', self.interface], capture_output=True, text=True)
-        if "UP" in result.stdout:
+        if self.probe_result(probes, 'link_state') == 'up':
             logger.info(f"✅ Check 2/4: Interface {self.interface} is UP")
             checks_passed += 1
         else:
             logger.error(f"❌ Check 2/4: Interface {self.interface} is DOWN")
         
-        # Check 3: SSID in scan
-        try:
-            result = subprocess.run(
-                ['iw', 'dev', self.interface, 'scan'],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            if self.ssid in result.stdout:
-                logger.info(f"✅ Check 3/4: SSID '{self.ssid}' visible in scan")
-                checks_passed += 1
-            else:
-                logger.warning(f"⚠️ Check 3/4: SSID not in scan (may need more time)")
-        except:
-            logger.warning("⚠️ Check 3/4: Could not perform scan")
+        # Check 3: SSID broadcasting, as reported by hostapd itself
+        status = self.probe_result(probes, 'hostapd_status')
+        if status is None:
+            logger.warning("⚠️ Check 3/4: Could not query hostapd status")
+        elif 'state=ENABLED' in status and f'ssid[0]={self.ssid}' in status:
+            logger.info(f"✅ Check 3/4: SSID '{self.ssid}' is broadcasting")
+            checks_passed += 1
+        else:
+            logger.warning(f"⚠️ Check 3/4: hostapd is not broadcasting the SSID yet (may need more time)")
         
         # Check 4: Interface in AP mode
-        try:
-            result = subprocess.run(['iw', 'dev', self.interface, 'info'], capture_output=True, text=True)
-            if 'type AP' in result.stdout or 'type managed' in result.stdout:
-                logger.info("✅ Check 4/4: Interface in correct mode")
-                checks_passed += 1
-            else:
-                logger.warning("⚠️ Check 4/4: Interface mode unclear")
-        except:
+        interface_info = self.probe_result(probes, 'interface_info')
+        if interface_info is None:
             logger.warning("⚠️ Check 4/4: Could not check interface mode")
+        elif 'type AP' in interface_info or 'type managed' in interface_info:
+            logger.info("✅ Check 4/4: Interface in correct mode")
+            checks_passed += 1
+        else:
+            logger.warning("⚠️ Check 4/4: Interface mode unclear")
         
         logger.info("=" * 60)
         logger.info(f"📊 Visibility Score: {checks_passed}/{total_checks} checks passed")
@@ -519,26 +678,16 @@ dhcp-option=114,http://192.168.4.1:5000/
             self.dnsmasq_process.terminate()
             self.dnsmasq_process.wait()
         
-        # Clean up iptables rules
+        self.stop_link_monitor()
+        
+        # Clean up firewall rules
         try:
-            internet_interface = self.find_internet_interface()
-            subprocess.run(['iptables', '-t', 'nat', '-D', 'POSTROUTING', '-o', internet_interface, '-j', 'MASQUERADE'], check=False)
-            subprocess.run(['iptables', '-D', 'FORWARD', '-i', self.interface, '-o', internet_interface, '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-D', 'FORWARD', '-i', internet_interface, '-o', self.interface, '-m', 'state', '--state', 'RELATED,ESTABLISHED', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-t', 'nat', '-D', 'PREROUTING', '-i', self.interface, '-p', 'tcp', '--dport', '80', '-j', 'DNAT', '--to-destination', '192.168.4.1:5000'], check=False)
-            subprocess.run(['iptables', '-t', 'nat', '-D', 'PREROUTING', '-i', self.interface, '-p', 'tcp', '--dport', '443', '-j', 'DNAT', '--to-destination', '192.168.4.1:5000'], check=False)
-            subprocess.run(['iptables', '-t', 'nat', '-D', 'PREROUTING', '-i', self.interface, '-p', 'udp', '--dport', '53', '-j', 'DNAT', '--to-destination', '192.168.4.1:53'], check=False)
-            subprocess.run(['iptables', '-D', 'INPUT', '-i', self.interface, '-p', 'icmp', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-D', 'INPUT', '-i', self.interface, '-p', 'udp', '--dport', '67', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-D', 'INPUT', '-i', self.interface, '-p', 'udp', '--dport', '68', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-D', 'INPUT', '-i', self.interface, '-p', 'udp', '--dport', '53', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-D', 'INPUT', '-i', self.interface, '-p', 'tcp', '--dport', '53', '-j', 'ACCEPT'], check=False)
-            subprocess.run(['iptables', '-D', 'INPUT', '-i', self.interface, '-p', 'tcp', '--dport', '5000', '-j', 'ACCEPT'], check=False)
+            self.remove_firewall_rules()
         except:
             pass
         
         # Clean up temporary files
-        for file in ['/tmp/hostapd.conf', '/tmp/dnsmasq.conf', '/tmp/dnsmasq.leases']:
+        for file in ['/tmp/hostapd.conf', '/tmp/dnsmasq.conf', '/tmp/dnsmasq.leases', CAPTIVE_HOSTS_FILE]:
             try:
                 os.remove(file)
             except:
@@ -546,88 +695,218 @@ dhcp-option=114,http://192.168.4.1:5000/
         
         logger.info("✅ Cleanup completed")
     
+    def read_operstate(self):
+        """Read the interface link state ('up', 'down', ...) from sysfs"""
+        with open(f'/sys/class/net/{self.interface}/operstate') as f:
+            return f.read().strip()
+
+    def get_link_state(self):
+        """Return the link state tracked by the link monitor, or read it from sysfs if not monitoring"""
+        if self._ip_monitor is not None and self._ip_monitor.poll() is None:
+            return self._link_state
+        return self.read_operstate()
+
+    def start_link_monitor(self):
+        """Follow link state changes of the hotspot interface with one long-lived 'ip monitor' process"""
+        try:
+            self._link_state = self.read_operstate()
+            self._ip_monitor = subprocess.Popen(
+                ['ip', '-o', 'monitor', 'link', 'dev', self.interface],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                bufsize=1
+            )
+            threading.Thread(target=self.watch_link_events, daemon=True).start()
+        except Exception as e:
+            logger.warning(f"Could not start link monitor: {e}")
+
+    def watch_link_events(self):
+        """Update the tracked link state from 'ip monitor' output and log link flaps"""
+        for line in self._ip_monitor.stdout:
+            if line.startswith('Deleted'):
+                state = 'absent'
+            else:
+                match = LINK_STATE_RE.search(line)
+                if not match:
+                    continue
+                state = match.group(1).lower()
+            if state == self._link_state:
+                continue
+            self._link_state = state
+            if state == 'up':
+                logger.info(f"🔗 Interface {self.interface} link is up")
+            else:
+                logger.warning(f"⚠️ Interface {self.interface} link is {state}")
+
+    def stop_link_monitor(self):
+        """Stop the 'ip monitor' process"""
+        if self._ip_monitor:
+            self._ip_monitor.terminate()
+            self._ip_monitor.wait()
+            self._ip_monitor = None
+
+    def iter_processes(self, field='comm'):
+        """Yield (pid, contents of /proc/<pid>/<field>) for every running process"""
+        for pid in os.listdir('/proc'):
+            if not pid.isdigit():
+                continue
+            try:
+                with open(f'/proc/{pid}/{field}', errors='replace') as f:
+                    yield int(pid), f.read()
+            except OSError:
+                # Process exited while we were scanning
+                continue
+
+    def running_process_names(self):
+        """Return the names of all running processes, read from /proc/<pid>/comm"""
+        return {comm.strip() for _, comm in self.iter_processes()}
+
+    def kill_processes(self, name=None, cmdline_pattern=None):
+        """SIGTERM processes called name, or whose command line matches cmdline_pattern (like pkill / pkill -f)"""
+        if cmdline_pattern is not None:
+            pattern = re.compile(cmdline_pattern)
+            pids = [pid for pid, cmdline in self.iter_processes('cmdline')
+                    if pattern.search(cmdline.replace('\0', ' '))]
+        else:
+            pids = [pid for pid, comm in self.iter_processes() if comm.strip() == name]
+        for pid in pids:
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def probe_system_state(self, names):
+        """Run the named health probes concurrently; returns {name: result or the exception raised}"""
+        def command_output(argv):
+            return subprocess.run(argv, capture_output=True, text=True).stdout
+        
+        available = {
+            'processes': self.running_process_names,
+            'link_state': self.get_link_state,
+            'hostapd_status': self.hostapd_status,
+            'interface_info': lambda: command_output(['iw', 'dev', self.interface, 'info']),
+            'rfkill': lambda: command_output(['rfkill', 'list']),
+            'nat_rules': lambda: command_output(['nft', 'list', 'table', 'inet', NFT_TABLE]),
+            'chains': lambda: command_output(['nft', 'list', 'chains']),
+        }
+        probes = {name: available[name] for name in names}
+        results = {}
+        with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+            futures = {executor.submit(probe): name for name, probe in probes.items()}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = e
+        return results
+
+    def probe_result(self, probes, name, default=None):
+        """Return a probe's result, or default if the probe raised"""
+        result = probes[name]
+        return default if isinstance(result, Exception) else result
+
     def diagnose_issues(self):
         """Diagnose common auto-reconnection issues"""
         logger.info("🔍 Diagnosing issues...")
         
         issues = []
         
-        # Check if hostapd is running
-        try:
-            result = subprocess.run(['pgrep', 'hostapd'], capture_output=True, text=True)
-            if result.returncode != 0:
-                issues.append("hostapd is not running")
-            else:
-                logger.info("✅ hostapd is running")
-        except Exception as e:
-            issues.append(f"Error checking hostapd: {e}")
+        probes = self.probe_system_state(('processes', 'link_state', 'rfkill', 'nat_rules', 'chains'))
         
-        # Check if dnsmasq is running
-        try:
-            result = subprocess.run(['pgrep', 'dnsmasq'], capture_output=True, text=True)
-            if result.returncode != 0:
-                issues.append("dnsmasq is not running")
+        # Check if hostapd and dnsmasq are running
+        running = probes['processes']
+        for service in ('hostapd', 'dnsmasq'):
+            if isinstance(running, Exception):
+                issues.append(f"Error checking {service}: {running}")
+            elif service not in running:
+                issues.append(f"{service} is not running")
             else:
-                logger.info("✅ dnsmasq is running")
-        except Exception as e:
-            issues.append(f"Error checking dnsmasq: {e}")
+                logger.info(f"✅ {service} is running")
         
         # Check interface status
-        try:
-            result = subprocess.run(['ip', 'link', 'show', self.interface], capture_output=True, text=True)
-            if "UP" not in result.stdout:
-                issues.append(f"Interface {self.interface} is not UP")
-            else:
-                logger.info(f"✅ Interface {self.interface} is UP")
-        except Exception as e:
-            issues.append(f"Error checking interface: {e}")
+        operstate = probes['link_state']
+        if isinstance(operstate, Exception):
+            issues.append(f"Error checking interface: {operstate}")
+        elif operstate != 'up':
+            issues.append(f"Interface {self.interface} is not UP (state: {operstate})")
+        else:
+            logger.info(f"✅ Interface {self.interface} is UP")
         
         # Check rfkill
-        try:
-            result = subprocess.run(['rfkill', 'list'], capture_output=True, text=True)
-            if "Soft blocked: yes" in result.stdout:
-                issues.append("Wireless is blocked by rfkill")
-            else:
-                logger.info("✅ Wireless not blocked")
-        except Exception as e:
-            logger.warning(f"Could not check rfkill: {e}")
+        rfkill = probes['rfkill']
+        if isinstance(rfkill, Exception):
+            logger.warning(f"Could not check rfkill: {rfkill}")
+        elif "Soft blocked: yes" in rfkill:
+            issues.append("Wireless is blocked by rfkill")
+        else:
+            logger.info("✅ Wireless not blocked")
         
         # Check DHCP leases
         lease_file = "/tmp/dnsmasq.leases"
         if os.path.exists(lease_file):
             logger.info("✅ DHCP lease file exists")
-            with open(lease_file, 'r') as f:
-                leases = f.read()
-                if leases.strip():
-                    logger.info(f"📋 Active DHCP leases: {len(leases.strip().split(chr(10)))}")
+            with open(lease_file, 'rb') as f:
+                active_leases = sum(1 for line in f if line.strip())
+                if active_leases:
+                    logger.info(f"📋 Active DHCP leases: {active_leases}")
                 else:
                     issues.append("No active DHCP leases found")
         else:
             issues.append("DHCP lease file not found")
         
-        # Check iptables rules
-        try:
-            result = subprocess.run(['iptables', '-t', 'nat', '-L'], capture_output=True, text=True)
-            if "192.168.4.1:5000" not in result.stdout:
-                issues.append("Captive portal iptables rules missing")
-            else:
-                logger.info("✅ Captive portal iptables rules present")
-        except Exception as e:
-            issues.append(f"Error checking iptables: {e}")
+        # Check firewall rules
+        nat_rules = probes['nat_rules']
+        if isinstance(nat_rules, Exception):
+            issues.append(f"Error checking nftables: {nat_rules}")
+        elif "192.168.4.1:5000" not in nat_rules:
+            issues.append("Captive portal nftables rules missing")
+        else:
+            logger.info("✅ Captive portal nftables rules present")
+        
+        # A drop policy on another table's input/forward chain (Docker, ufw,
+        # iptables-nft) blocks DHCP/DNS/portal traffic or client forwarding
+        chains = probes['chains']
+        if isinstance(chains, Exception):
+            logger.warning(f"Could not check input/forward policies: {chains}")
+        else:
+            for table, hook in self.drop_policy_chains(chains):
+                if hook == 'input':
+                    issues.append(f"Table '{table}' drops input traffic by default - allow DHCP (udp 67), "
+                                  f"DNS (53) and the portal (tcp 5000) on {self.interface} there")
+                else:
+                    issues.append(f"Table '{table}' drops forwarded traffic by default - "
+                                  f"allow forwarding for {self.interface} there")
         
         return issues
 
+    def drop_policy_chains(self, chains):
+        """Return (table, hook) for every input/forward base chain with a drop policy"""
+        found = []
+        table = None
+        for line in chains.splitlines():
+            match = NFT_TABLE_HEADER_RE.match(line)
+            if match:
+                table = match.group(1)
+                continue
+            match = NFT_DROP_HOOK_RE.search(line)
+            if match and (table, match.group(1)) not in found:
+                found.append((table, match.group(1)))
+        return found
+
     def stop(self):
         """Stop the hotspot portal"""
         self.running = False
+        self._stop_event.set()
 
-    def start(self, diagnose=False):
+    def start(self, diagnose=False, verbose=False):
         """Start the hotspot portal"""
         try:
             self.check_root()
             self.check_dependencies()
 
-            # Validate interface before proceeding
             if not self.validate_interface():
                 logger.error(f"Interface {self.interface} is not valid for hotspot use")
                 logger.error("Use 'ip link show' to find available interfaces")
@@ -649,16 +928,21 @@ dhcp-option=114,http://192.168.4.1:5000/
 
             # Create configuration files
             self.create_hostapd_config()
-            self.verify_hostapd_config()
-            self.create_dnsmasq_config()
+            self.create_dnsmasq_config(verbose=verbose)
 
             # Setup network
             self.setup_network()
 
-            # Start services
-            self.start_hostapd()
-            self.start_dnsmasq()
-            self.start_flask()
+            # Start services concurrently; each one waits on its own readiness probe
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                services = [
+                    executor.submit(self.start_hostapd),
+                    executor.submit(self.start_dnsmasq),
+                    executor.submit(self.start_flask),
+                ]
+            for service in services:
+                service.result()
+            self.start_link_monitor()
 
             # Verify visibility
             self.verify_hotspot_visible()
@@ -686,10 +970,9 @@ dhcp-option=114,http://192.168.4.1:5000/
             logger.info("   • Run: sudo python3 {} --diagnose".format(sys.argv[0]))
             logger.info("=" * 60)
 
-            # Keep running until interrupted
+            # Block until stop() is called or we are interrupted
             try:
-                while self.running:
-                    time.sleep(1)
+                self._stop_event.wait()
             except KeyboardInterrupt:
                 logger.info("\n⏹️  Received interrupt signal")
 
@@ -714,12 +997,18 @@ def main():
     password = "portal123"
     interface = "wlan0"
     diagnose = False
+    verbose = False
     
     # Check for diagnostic mode
     if "--diagnose" in sys.argv or "-d" in sys.argv:
         diagnose = True
         sys.argv.remove("--diagnose" if "--diagnose" in sys.argv else "-d")
     
+    # Check for verbose dnsmasq logging
+    if "--verbose" in sys.argv or "-v" in sys.argv:
+        verbose = True
+        sys.argv.remove("--verbose" if "--verbose" in sys.argv else "-v")
+    
     if len(sys.argv) > 1:
         ssid = sys.argv[1]
     if len(sys.argv) > 2:
@@ -736,7 +1025,7 @@ def main():
     signal.signal(signal.SIGTERM, signal_handler)
     
     # Start the portal
-    portal.start(diagnose=diagnose)
+    portal.start(diagnose=diagnose, verbose=verbose)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -17,7 +17,7 @@ apt update
 
 # Install system dependencies
 echo "🔧 Installing system dependencies..."
-apt install -y hostapd dnsmasq iptables python3-pip
+apt install -y hostapd dnsmasq nftables python3-pip
 
 # Install Python dependencies
 echo "🐍 Installing Python dependencies..."
@@ -4,133 +4,148 @@ Web Application Module for Active Portal
 Handles all Flask routes and web interface logic
 """
 
+import json
 import logging
-from flask import Flask, render_template, request, redirect, url_for
+import waitress
+from flask import Flask, Response, render_template, request, redirect, url_for
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Templates served to every client; none of them take per-request context
+STATIC_PAGES = ('portal', 'welcome', 'success')
+
+# Captive portal detection URLs that are redirected to the portal. The
+# Location is relative so it resolves against whichever probe host the
+# client asked for, which dnsmasq answers with the portal address.
+REDIRECT_PATHS = (
+    '/generate_204',               # Android
+    '/hotspot-detect.html',        # Apple
+)
+
+# Captive portal detection URLs that get the portal page
+PORTAL_PATHS = (
+    '/library/test/success.html',  # iOS
+    '/hotspot.html',               # macOS
+    '/windows/redirect',           # Windows 10/11
+    '/connectivity-check.html',
+    '/canonical.html',
+    '/redirect',
+    '/mobile/redirect',
+)
+
+# Plain-text connectivity check bodies
+NCSI_BODY = b"Microsoft NCSI"
+SUCCESS_BODY = b"Success"
+
+# Captive portal API bodies; the payloads are constant, so serialize them once
+API_CONNECTIVITY_BODY = json.dumps({"status": "captive_portal", "redirect_url": "/"}).encode('utf-8')
+API_STATUS_BODY = json.dumps({"connected": False, "portal_required": True}).encode('utf-8')
+
 class WebApp:
     def __init__(self, host='192.168.4.1', port=5000):
         self.host = host
         self.port = port
         self.app = Flask(__name__)
+        self.pages = self.render_pages()
         self.setup_routes()
+
+    def render_pages(self):
+        """Render the static templates once so requests skip Jinja entirely"""
+        with self.app.app_context():
+            return {name: render_template(f'{name}.html').encode('utf-8') for name in STATIC_PAGES}
+
+    def page(self, name):
+        """Response for a pre-rendered page (re-rendered live in debug mode so template edits show up)"""
+        if self.app.debug:
+            return render_template(f'{name}.html')
+        return Response(self.pages[name], mimetype='text/html')
     
     def setup_routes(self):
         """Setup Flask routes for the captive portal"""
+        add = self.app.add_url_rule
+        add('/', 'index', self.index)
+        add('/welcome', 'welcome', self.welcome)
+        add('/success', 'success', self.success)
+        add('/submit', 'submit', self.submit, methods=['POST'])
         
-        @self.app.route('/')
-        def index():
-            """Main portal page - registration form"""
-            return render_template('portal.html')
-            
-        @self.app.route('/welcome')
-        def welcome():
-            """Welcome page with service information"""
-            return render_template('welcome.html')
-            
-        @self.app.route('/success')
-        def success():
-            """Success page after form submission"""
-            return render_template('success.html')
-            
-        @self.app.route('/submit', methods=['POST'])
-        def submit():
-            """Handle form submission"""
-            name = request.form.get('name', '')
-            email = request.form.get('email', '')
-            logger.info(f"Portal submission - Name: {name}, Email: {email}")
-            return redirect(url_for('success'))
-        
-        # Handle HTTPS traffic (for apps)
-        @self.app.route('/<path:path>', methods=['GET', 'POST'])
-        def catch_all(path):
-            """Catch-all route for any other requests"""
-            # If it's a POST request, it might be an app trying to connect
-            if request.method == 'POST':
-                return render_template('portal.html')
-            # For GET requests, show portal
-            return render_template('portal.html')
-        
-        # Handle root domain requests
-        @self.app.route('/generate_204')
-        def generate_204():
-            """Android connectivity check endpoint"""
-            return render_template('portal.html')
-        
-        # Handle Android captive portal detection
-        @self.app.route('/hotspot-detect.html')
-        def hotspot_detect():
-            """Android captive portal detection endpoint"""
-            return render_template('portal.html')
-        
-        # Handle iOS captive portal detection
-        @self.app.route('/library/test/success.html')
-        def ios_detect():
-            """iOS captive portal detection endpoint"""
-            return render_template('portal.html')
-        
-        # Additional captive portal detection endpoints
-        @self.app.route('/ncsi.txt')
-        def ncsi_detect():
-            """Windows Network Connectivity Status Indicator"""
-            return "Microsoft NCSI", 200
-        
-        @self.app.route('/connectivity-check.html')
-        def connectivity_check():
-            """Generic connectivity check"""
-            return render_template('portal.html')
-        
-        @self.app.route('/redirect')
-        def redirect_detect():
-            """Generic redirect endpoint"""
-            return render_template('portal.html')
-        
-        @self.app.route('/success.txt')
-        def success_txt():
-            """Text-based success endpoint"""
-            return "Success", 200
+        # Captive portal detection endpoints probed by each OS; the probes
+        # that accept a redirect get a bodiless 302, the rest (and the
+        # catch-all) are served by a single portal view
+        for rule in REDIRECT_PATHS:
+            add(rule, 'portal_redirect', self.portal_redirect)
+        for rule in PORTAL_PATHS:
+            add(rule, 'portal', self.portal)
+        # Catch-all for any other requests (POSTs may be apps trying to connect)
+        add('/<path:path>', 'portal', self.portal, methods=['GET', 'POST'])
         
-        @self.app.route('/canonical.html')
-        def canonical_detect():
-            """Canonical captive portal detection"""
-            return render_template('portal.html')
+        add('/ncsi.txt', 'ncsi_detect', self.ncsi_detect)
+        add('/success.txt', 'success_txt', self.success_txt)
         
-        # Handle Windows 10/11 captive portal detection
-        @self.app.route('/windows/redirect')
-        def windows_redirect():
-            """Windows captive portal redirect"""
-            return render_template('portal.html')
+        # Captive portal API endpoints
+        add('/api/v1/connectivity', 'api_connectivity', self.api_connectivity)
+        add('/api/v1/status', 'api_status', self.api_status)
         
-        # Handle macOS captive portal detection
-        @self.app.route('/hotspot.html')
-        def macos_detect():
-            """macOS captive portal detection"""
-            return render_template('portal.html')
-        
-        # Handle various mobile device detection
-        @self.app.route('/mobile/redirect')
-        def mobile_redirect():
-            """Mobile device redirect"""
-            return render_template('portal.html')
-        
-        # Handle captive portal API endpoints
-        @self.app.route('/api/v1/connectivity')
-        def api_connectivity():
-            """API connectivity check"""
-            return {"status": "captive_portal", "redirect_url": "/"}, 200
-        
-        @self.app.route('/api/v1/status')
-        def api_status():
-            """API status check"""
-            return {"connected": False, "portal_required": True}, 200
+        self.app.after_request(self.no_store)
+    
+    def no_store(self, response):
+        """Forbid caching so detectors never reuse a stale portal answer and reprobe"""
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    
+    def index(self):
+        """Main portal page - registration form"""
+        return self.page('portal')
+    
+    def welcome(self):
+        """Welcome page with service information"""
+        return self.page('welcome')
+    
+    def success(self):
+        """Success page after form submission"""
+        return self.page('success')
+    
+    def submit(self):
+        """Handle form submission"""
+        name = request.form.get('name', '')
+        email = request.form.get('email', '')
+        logger.info("Portal submission - Name: %s, Email: %s", name, email)
+        return redirect(url_for('success'))
+    
+    def portal(self, path=None):
+        """Captive portal detection endpoints and catch-all"""
+        return self.page('portal')
+    
+    def portal_redirect(self):
+        """Redirect a connectivity probe to the portal (anything but 204/Success means captive)"""
+        return Response(status=302, headers={'Location': '/'})
+    
+    def ncsi_detect(self):
+        """Windows Network Connectivity Status Indicator"""
+        return Response(NCSI_BODY, mimetype='text/plain')
+    
+    def success_txt(self):
+        """Text-based success endpoint"""
+        return Response(SUCCESS_BODY, mimetype='text/plain')
+    
+    def api_connectivity(self):
+        """API connectivity check"""
+        return Response(API_CONNECTIVITY_BODY, mimetype='application/json')
+    
+    def api_status(self):
+        """API status check"""
+        return Response(API_STATUS_BODY, mimetype='application/json')
     
-    def run(self, debug=False):
-        """Start the Flask web server"""
+    def run(self, debug=False, threads=16, connection_limit=200):
+        """Start the web server (waitress; Flask's development server only when debug=True)"""
         try:
-            logger.info(f"Starting Flask web server on {self.host}:{self.port}")
-            self.app.run(host=self.host, port=self.port, debug=debug)
+            if debug:
+                logger.info(f"Starting Flask development server on {self.host}:{self.port}")
+                self.app.run(host=self.host, port=self.port, debug=debug)
+            else:
+                logger.info(f"Starting waitress web server on {self.host}:{self.port}")
+                waitress.serve(self.app, host=self.host, port=self.port,
+                               threads=threads, connection_limit=connection_limit)
         except Exception as e:
             logger.error(f"Failed to start Flask web server: {e}")
             raise